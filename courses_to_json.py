@@ -1,20 +1,29 @@
 import argparse
 import hashlib
-import json
+import os
 import re
+import threading
 import time
 import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timezone
 from functools import cache
 from itertools import repeat
-from multiprocessing import Pool
 from pathlib import Path
 from typing import Any, Optional
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
-POOL_CONCURRENT_PROCESSES = 16
+POOL_CONCURRENT_THREADS = 16
+
+# Courses are fetched together with their schedules, so each batch request has
+# twice as many parts.
+COURSES_PER_BATCH_REQUEST = 20
 
 CACHE_DIR_PATH = Path(".cache_dir")
 CACHE_DIR: Optional[Path] = (
@@ -22,11 +31,149 @@ CACHE_DIR: Optional[Path] = (
     if CACHE_DIR_PATH.exists()
     else None
 )
+# Whether to ignore the existing cached responses, still caching the new ones.
+CACHE_REFRESH = False
 
 VERBOSE_LOGGING = False
 
+# Connect and read timeouts, in seconds.
+REQUEST_TIMEOUT = (30, 300)
+
+# Patterns compiled once, since they're used for every request, course, event
+# and exam.
+CACHE_NAME_INVALID_CHARS_RE = re.compile(r"[<>:\"/\\|?*]")
+OLD_SPORT_COURSE_NUMBER_RE = re.compile(r'^9730(\d\d)$')
+OLD_COURSE_NUMBER_RE = re.compile(r'^(\d\d\d)(\d\d\d)$')
+SPORT_COURSE_NUMBER_RE = re.compile(r'03940[89]\d\d')
+WHITESPACE_RE = re.compile(r"\s+")
+ROOM_NAME_RE = re.compile(r"(\d\d\d)-(\d\d\d\d)")
+EVENT_TIME_RE = re.compile(r"PT(\d\d)H(\d\d)M00S")
+SCHEDULE_GROUP_PREFIX_RE = re.compile(r'^SE\d+\s*')
+SCHEDULE_SINGLE_DATE_RE = re.compile(r"\d\d\.\d\d\.: \d\d:\d\d-\d\d:\d\d")
+SCHEDULE_MULTIPLE_DATES_RE = re.compile(r"(\d\d\.\d\d\., )+בהתאמה \d\d:\d\d-\d\d:\d\d")
+# Date prefixes (from, until, range) and suffixes (exceptions, repetition) to
+# strip from a schedule, matched in a single pass.
+SCHEDULE_DATES_RE = re.compile(
+    r"^(?:(?:מ|עד|\d\d\.\d\d\. עד) \d\d\.\d\d\., )+"
+    r"|(?:, הכל \d+ ימים)?, יוצא מן הכלל: .*$"
+    r"|, הכל \d+ ימים$"
+)
+POINTS_TRAILING_ZEROS_RE = re.compile(r"(\.[1-9]+)0+$|\.0+$")
+PREREQ_SINGLE_COURSE_RE = re.compile(r"\((\d+)\)")
+PREREQ_OUTER_PARENTHESES_RE = re.compile(r"^\(([^()]+)\)$")
+ADJOINING_COURSES_RE = re.compile(
+    r"^(?:מקצוע צמוד|מקצועות צמודים):(.*)", flags=re.MULTILINE
+)
+ADJOINING_COURSE_NUMBER_RE = re.compile(r"\d{5,8}")
+SCHEDULE_DAY_AND_TIME_RE = re.compile(
+    r"\s*(?:יום|יוֹם) (רִאשׁוֹ|שני|שלישי|רביעי|חמישי|שישי)"
+    r" (\d\d:\d\d)\s*-\s*(\d\d:\d\d)\s*"
+)
+
+SCHEDULE_CATEGORIES = frozenset(["הרצאה", "תרגול", "מעבדה", "פרויקט", "סמינר"])
+SPORT_SCHEDULE_CATEGORIES = frozenset(["ספורט", "נבחרת ספורט"])
+# All schedule event keys except for the group.
+SCHEDULE_EVENT_COMPARISON_KEYS = (
+    "סוג",
+    "יום",
+    "שעה",
+    "בניין",
+    "חדר",
+    "מרצה/מתרגל",
+    "מס.",
+)
+SCHEDULE_DAY_NAME_FIXES = {
+    "רִאשׁוֹ": "ראשון",
+}
+SCHEDULE_DAY_INDEXES = {
+    "ראשון": 0,
+    "שני": 1,
+    "שלישי": 2,
+    "רביעי": 3,
+    "חמישי": 4,
+    "שישי": 5,
+}
+
+# The static parts of the batch request body, so that only the queries are
+# encoded per request.
+BATCH_PART_PREFIX = (
+    b"--batch_1d12-afbf-e3c7\r\n"
+    b"Content-Type: application/http\r\n"
+    b"Content-Transfer-Encoding: binary\r\n"
+    b"\r\n"
+    b"GET "
+)
+BATCH_PART_SUFFIX = (
+    b" HTTP/1.1\r\n"
+    b"sap-cancel-on-close: true\r\n"
+    b"X-Requested-With: X\r\n"
+    b"sap-contextid-accept: header\r\n"
+    b"Accept: application/json\r\n"
+    b"Accept-Language: he\r\n"
+    b"DataServiceVersion: 2.0\r\n"
+    b"MaxDataServiceVersion: 2.0\r\n"
+    b"\r\n"
+    b"\r\n"
+)
+BATCH_END = b"--batch_1d12-afbf-e3c7--\r\n"
+
+# requests doesn't modify the headers it's given, so they can be shared by all
+# requests.
+BATCH_REQUEST_HEADERS = {
+    # "Host": "portalex.technion.ac.il",
+    # "Connection": "keep-alive",
+    # "Content-Length": "955",
+    "sec-ch-ua": '"Not/A)Brand";v="8", "Chromium";v="126", "Brave";v="126"',
+    "MaxDataServiceVersion": "2.0",
+    "Accept-Language": "he",
+    "sec-ch-ua-mobile": "?0",
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like"
+        " Gecko) Chrome/126.0.0.0 Safari/537.36"
+    ),
+    "Content-Type": "multipart/mixed;boundary=batch_1d12-afbf-e3c7",
+    "Accept": "multipart/mixed",
+    "sap-contextid-accept": "header",
+    "sap-cancel-on-close": "true",
+    "X-Requested-With": "X",
+    "DataServiceVersion": "2.0",
+    # "SAP-PASSPORT": SAP_PASSPORT,
+    "sec-ch-ua-platform": '"Windows"',
+    "Sec-GPC": "1",
+    "Origin": "https://portalex.technion.ac.il",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Dest": "empty",
+    "Referer": "https://portalex.technion.ac.il/ovv/",
+    # "Accept-Encoding": "gzip, deflate, br, zstd",
+    # "Cookie": SAP_COOKIE,
+}
+
 session = requests.session()
 
+
+def mount_http_adapter(pool_threads: int):
+    # Let urllib3 retry transient connection and server errors right away,
+    # and keep a connection alive for each of the pool threads to reuse.
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_maxsize=pool_threads,
+            max_retries=Retry(
+                total=5,
+                connect=5,
+                read=5,
+                status=5,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["POST"],
+            ),
+        ),
+    )
+
+
+mount_http_adapter(POOL_CONCURRENT_THREADS)
+
 session.proxies = {
     # Use fiddler as proxy
     # "http": "http://127.0.0.1:8888",
@@ -37,128 +184,199 @@ session.proxies = {
 }
 
 
-def send_request_once(query: str):
-    cache_file_path = None
-    if CACHE_DIR:
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+def get_cache_file_path(query: str):
+    if not CACHE_DIR:
+        return None
 
-        cache_name_prefix = re.sub(r"[<>:\"/\\|?*]", "_", query)[:64]
-        cache_hash = int.from_bytes(
-            hashlib.sha256(query.encode()).digest()[:8], "little"
-        )
-        cache_file_path = CACHE_DIR / f"{cache_name_prefix}_{cache_hash:x}.json"
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
-        if cache_file_path.exists():
-            with cache_file_path.open(encoding="utf-8") as f:
-                return json.load(f)
+    cache_name_prefix = CACHE_NAME_INVALID_CHARS_RE.sub("_", query[:64])
+    cache_hash = int.from_bytes(
+        hashlib.blake2b(query.encode(), digest_size=8).digest(), "little"
+    )
+    return CACHE_DIR / f"{cache_name_prefix}_{cache_hash:x}.json"
 
-    if VERBOSE_LOGGING:
-        print(f"Sending request: {query}")
 
-    url = "https://portalex.technion.ac.il/sap/opu/odata/sap/Z_CM_EV_CDIR_DATA_SRV/$batch?sap-client=700"
+def get_batch_response_json_bodies(response_content: bytes, part_count: int):
+    # The response parts are separated by the boundary in the first line, and
+    # are in the same order as the request parts. Each part has its MIME
+    # headers, the HTTP response headers and the JSON body, separated by empty
+    # lines. Only offsets into the raw bytes are searched, and the bodies are
+    # returned as views, to avoid copying the response.
+    response_view = memoryview(response_content)
 
-    headers = {
-        # "Host": "portalex.technion.ac.il",
-        # "Connection": "keep-alive",
-        # "Content-Length": "955",
-        "sec-ch-ua": '"Not/A)Brand";v="8", "Chromium";v="126", "Brave";v="126"',
-        "MaxDataServiceVersion": "2.0",
-        "Accept-Language": "he",
-        "sec-ch-ua-mobile": "?0",
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like"
-            " Gecko) Chrome/126.0.0.0 Safari/537.36"
-        ),
-        "Content-Type": "multipart/mixed;boundary=batch_1d12-afbf-e3c7",
-        "Accept": "multipart/mixed",
-        "sap-contextid-accept": "header",
-        "sap-cancel-on-close": "true",
-        "X-Requested-With": "X",
-        "DataServiceVersion": "2.0",
-        # "SAP-PASSPORT": SAP_PASSPORT,
-        "sec-ch-ua-platform": '"Windows"',
-        "Sec-GPC": "1",
-        "Origin": "https://portalex.technion.ac.il",
-        "Sec-Fetch-Site": "same-origin",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Dest": "empty",
-        "Referer": "https://portalex.technion.ac.il/ovv/",
-        # "Accept-Encoding": "gzip, deflate, br, zstd",
-        # "Cookie": SAP_COOKIE,
-    }
+    boundary_start = response_content.find(b"--")
+    boundary_end = response_content.find(b"\r\n", boundary_start)
+    if boundary_start == -1 or boundary_end == -1:
+        raise RuntimeError(f"Invalid response: {response_content}")
 
-    data = f"""
---batch_1d12-afbf-e3c7
-Content-Type: application/http
-Content-Transfer-Encoding: binary
+    boundary = response_content[boundary_start:boundary_end]
 
-GET {query} HTTP/1.1
-sap-cancel-on-close: true
-X-Requested-With: X
-sap-contextid-accept: header
-Accept: application/json
-Accept-Language: he
-DataServiceVersion: 2.0
-MaxDataServiceVersion: 2.0
+    json_bodies = []
+    part_start = boundary_end
+    for _ in range(part_count):
+        part_end = response_content.find(boundary, part_start)
+        headers_end = response_content.find(b"\r\n\r\n", part_start, part_end)
+        http_headers_end = response_content.find(b"\r\n\r\n", headers_end + 4, part_end)
+        if part_end == -1 or headers_end == -1 or http_headers_end == -1:
+            raise RuntimeError(f"Invalid response: {response_content}")
 
+        json_start = http_headers_end + 4
+        json_end = response_content.find(b"\r\n", json_start, part_end)
+        if json_end == -1:
+            json_end = part_end
 
---batch_1d12-afbf-e3c7--
-"""
-    data = data.replace("\n", "\r\n")
+        json_bodies.append(response_view[json_start:json_end])
+        part_start = part_end + len(boundary)
+
+    if response_content[part_start : part_start + 2] != b"--":
+        raise RuntimeError(f"Invalid response: {response_content}")
+
+    return json_bodies
+
+
+def send_batch_request_once(queries: list[str]):
+    results = {}
+    cache_file_paths = {}
+    for query in queries:
+        if query in results or query in cache_file_paths:
+            continue
+
+        cache_file_path = get_cache_file_path(query)
+        if cache_file_path and not CACHE_REFRESH and cache_file_path.exists():
+            results[query] = orjson.loads(cache_file_path.read_bytes())
+        else:
+            cache_file_paths[query] = cache_file_path
+
+    pending_queries = list(cache_file_paths)
+    if not pending_queries:
+        return [results[query] for query in queries]
+
+    if VERBOSE_LOGGING:
+        for query in pending_queries:
+            print(f"Sending request: {query}")
+
+    url = "https://portalex.technion.ac.il/sap/opu/odata/sap/Z_CM_EV_CDIR_DATA_SRV/$batch?sap-client=700"
+
+    # A single batch with a GET request part for each query.
+    data = b"".join(
+        [
+            b"\r\n",
+            *(
+                BATCH_PART_PREFIX + query.encode() + BATCH_PART_SUFFIX
+                for query in pending_queries
+            ),
+            BATCH_END,
+        ]
+    )
 
-    response = session.post(url, headers=headers, data=data)
+    response = session.post(
+        url, headers=BATCH_REQUEST_HEADERS, data=data, timeout=REQUEST_TIMEOUT
+    )
     if response.status_code != 202:
         raise RuntimeError(f"Bad status code: {response.status_code}, expected 202")
 
-    response_chunks = response.text.replace("\r\n", "\n").strip().split("\n\n")
-    if len(response_chunks) != 3:
-        raise RuntimeError(f"Invalid response: {response_chunks}")
+    json_bodies = get_batch_response_json_bodies(response.content, len(pending_queries))
 
-    json_str = response_chunks[2].split("\n", 1)[0]
+    for query, json_body in zip(pending_queries, json_bodies):
+        if VERBOSE_LOGGING:
+            print(f"Got {len(json_body)} bytes")
 
-    if VERBOSE_LOGGING:
-        print(f"Got {len(json_str)} bytes")
+        result = orjson.loads(json_body)
 
-    result = json.loads(json_str)
+        cache_file_path = cache_file_paths[query]
+        if cache_file_path:
+            # Write to a temporary file first, so that other threads never
+            # read a partially written cache file.
+            temp_file_path = cache_file_path.with_name(
+                f"{cache_file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            temp_file_path.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+            temp_file_path.replace(cache_file_path)
 
-    if cache_file_path:
-        with cache_file_path.open("w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        results[query] = result
 
-    return result
+    return [results[query] for query in queries]
 
 
-def send_request(query: str):
+# Set when a run is aborted, so that threads waiting to retry a request give
+# up instead of keeping the process alive.
+stop_retrying = threading.Event()
+
+
+def send_batch_request(queries: list[str]):
+    # Only transport errors are worth waiting for, other errors such as
+    # unexpected responses are raised immediately.
     delay = 5
     while True:
         try:
-            return send_request_once(query)
-        except Exception as e:
+            return send_batch_request_once(queries)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.RetryError,
+        ) as e:
             print(f"Error: {e}")
-            time.sleep(delay)
+            if stop_retrying.wait(delay):
+                raise
             delay = min(delay * 2, 300)
 
 
-def sap_date_parse(date_str: str):
-    match = re.fullmatch(r"/Date\((\d+)\)/", date_str)
-    if not match:
+def send_request(query: str):
+    return send_batch_request([query])[0]
+
+
+def sap_date_milliseconds(date_str: str):
+    # A fixed "/Date(<ms>)/" format, sliced instead of matched with a regex.
+    milliseconds = date_str[6:-2]
+    if not (
+        date_str.startswith("/Date(")
+        and date_str.endswith(")/")
+        and milliseconds.isdecimal()
+    ):
         raise RuntimeError(f"Invalid date: {date_str}")
 
-    return datetime.fromtimestamp(int(match.group(1)) / 1000, timezone.utc)
+    return int(milliseconds)
+
+
+def sap_date_parse(date_str: str):
+    return datetime.fromtimestamp(sap_date_milliseconds(date_str) / 1000, timezone.utc)
+
+
+def sap_date_weekday(date_str: str):
+    # Days since the epoch, which was a Thursday, with Sunday as 0.
+    return (sap_date_milliseconds(date_str) // (1000 * 60 * 60 * 24) + 4) % 7
+
+
+def sap_exam_time_parse(time_str: str):
+    # A fixed "PT<hh>H<mm>M<ss>S" format, sliced instead of matched with a regex.
+    if not (
+        len(time_str) == 11
+        and time_str.startswith("PT")
+        and time_str[4] == "H"
+        and time_str[7] == "M"
+        and time_str[10] == "S"
+        and (time_str[2:4] + time_str[5:7] + time_str[8:10]).isdecimal()
+    ):
+        raise RuntimeError(f"Invalid time: {time_str}")
+
+    return f"{time_str[2:4]}:{time_str[5:7]}"
 
 
 def to_new_course_number(course):
-    match = re.match(r'^9730(\d\d)$', course)
+    match = OLD_SPORT_COURSE_NUMBER_RE.match(course)
     if match:
         return '970300' + match.group(1)
 
-    match = re.match(r'^(\d\d\d)(\d\d\d)$', course)
+    match = OLD_COURSE_NUMBER_RE.match(course)
     if match:
         return '0' + match.group(1) + '0' + match.group(2)
 
     return course
 
 
+@cache
 def get_last_semesters(semester_count: int):
     params = {
         "sap-client": "700",
@@ -184,8 +402,10 @@ def get_last_semesters(semester_count: int):
         if semester not in [200, 201, 202]:
             continue
 
-        begin_date = sap_date_parse(result["Begda"]).strftime("%Y-%m-%d")
-        end_date = sap_date_parse(result["Endda"]).strftime("%Y-%m-%d")
+        begin = sap_date_parse(result["Begda"])
+        begin_date = f"{begin.year:04d}-{begin.month:02d}-{begin.day:02d}"
+        end = sap_date_parse(result["Endda"])
+        end_date = f"{end.year:04d}-{end.month:02d}-{end.day:02d}"
 
         results.append(
             {
@@ -202,6 +422,7 @@ def get_last_semesters(semester_count: int):
     return sorted(results, key=results_sort_key, reverse=True)[:semester_count]
 
 
+@cache
 def get_sap_course_numbers(year: int, semester: int):
     params = {
         "sap-client": "700",
@@ -216,10 +437,10 @@ def get_sap_course_numbers(year: int, semester: int):
         # "$inlinecount": "allpages",
     }
     raw_data = send_request(f"SmObjectSet?{urllib.parse.urlencode(params)}")
-    return [x["Otjid"] for x in raw_data["d"]["results"]]
+    return sorted(x["Otjid"] for x in raw_data["d"]["results"])
 
 
-def get_sap_course(year: int, semester: int, course: str):
+def get_sap_course_query(year: int, semester: int, course: str):
     params = {
         "sap-client": "700",
         # "$skip": "0",
@@ -254,7 +475,10 @@ def get_sap_course(year: int, semester: int, course: str):
         ),
         # "$inlinecount": "allpages",
     }
-    raw_data = send_request(f"SmObjectSet?{urllib.parse.urlencode(params)}")
+    return f"SmObjectSet?{urllib.parse.urlencode(params)}"
+
+
+def parse_sap_course(course: str, raw_data: dict[str, Any]):
     results = raw_data["d"]["results"]
     if len(results) != 1:
         raise RuntimeError(f"Invalid results for {course}: {results}")
@@ -262,8 +486,14 @@ def get_sap_course(year: int, semester: int, course: str):
     return results[0]
 
 
-@cache
-def get_building_name(year: int, semester: int, room_id: str):
+# Building names by (year, semester, room_id), shared by all threads. Lookups
+# that are still in flight are stored too, so that each room is only fetched
+# once even if several threads need it at the same time.
+building_names_cache: dict[tuple[int, int, str], Future] = {}
+building_names_cache_lock = threading.Lock()
+
+
+def get_building_name_query(year: int, semester: int, room_id: str):
     params = {
         "sap-client": "700",
         "$select": ",".join(
@@ -272,14 +502,15 @@ def get_building_name(year: int, semester: int, room_id: str):
             ]
         ),
     }
-    raw_data = send_request(
-        f"GObjectSet(Otjid='{urllib.parse.quote(room_id)}',Peryr='{year}',Perid='{semester}')?{urllib.parse.urlencode(params)}"
-    )
+    return f"GObjectSet(Otjid='{urllib.parse.quote(room_id)}',Peryr='{year}',Perid='{semester}')?{urllib.parse.urlencode(params)}"
+
+
+def parse_building_name(room_id: str, raw_data: dict[str, Any]):
     building = raw_data["d"]["Building"]
     if not building:
         raise RuntimeError(f"Invalid building for room: {room_id}")
 
-    building = re.sub(r"\s+", " ", building.strip())
+    building = WHITESPACE_RE.sub(" ", building.strip())
 
     mapping = {
         "בנין אולמן": "אולמן",
@@ -306,7 +537,40 @@ def get_building_name(year: int, semester: int, room_id: str):
     return building
 
 
-def get_room_info(year: int, semester: int, event_schedule_id: str):
+def get_building_names(year: int, semester: int, room_ids: list[str]):
+    missing_room_ids = []
+    with building_names_cache_lock:
+        for room_id in dict.fromkeys(room_ids):
+            if (year, semester, room_id) not in building_names_cache:
+                building_names_cache[(year, semester, room_id)] = Future()
+                missing_room_ids.append(room_id)
+
+    # Fetch all of the missing building names in a single batch request.
+    try:
+        raw_data_list = send_batch_request(
+            [
+                get_building_name_query(year, semester, room_id)
+                for room_id in missing_room_ids
+            ]
+        )
+        for room_id, raw_data in zip(missing_room_ids, raw_data_list):
+            building_names_cache[(year, semester, room_id)].set_result(
+                parse_building_name(room_id, raw_data)
+            )
+    except Exception as e:
+        for room_id in missing_room_ids:
+            future = building_names_cache[(year, semester, room_id)]
+            if not future.done():
+                future.set_exception(e)
+        raise
+
+    return {
+        room_id: building_names_cache[(year, semester, room_id)].result()
+        for room_id in room_ids
+    }
+
+
+def get_room_info_query(year: int, semester: int, event_schedule_id: str):
     params = {
         "sap-client": "700",
         "$filter": (
@@ -321,9 +585,26 @@ def get_room_info(year: int, semester: int, event_schedule_id: str):
             ]
         ),
     }
-    raw_data = send_request(f"EventScheduleSet?{urllib.parse.urlencode(params)}")
-    results = raw_data["d"]["results"]
+    return f"EventScheduleSet?{urllib.parse.urlencode(params)}"
+
+
+def get_raw_room_infos(year: int, semester: int, event_schedule_ids: list[str]):
+    event_schedule_ids = list(dict.fromkeys(event_schedule_ids))
+    raw_data_list = send_batch_request(
+        [
+            get_room_info_query(year, semester, event_schedule_id)
+            for event_schedule_id in event_schedule_ids
+        ]
+    )
+    return {
+        event_schedule_id: raw_data["d"]["results"]
+        for event_schedule_id, raw_data in zip(event_schedule_ids, raw_data_list)
+    }
+
 
+def parse_room_info(
+    event_schedule_id: str, results: list[dict], building_names: dict[str, str]
+):
     rooms_by_time = {}
 
     for result in results:
@@ -337,17 +618,16 @@ def get_room_info(year: int, semester: int, event_schedule_id: str):
         if not date_raw or not begin_raw or not end_raw:
             raise RuntimeError(f"Missing date/time for {event_schedule_id}")
 
-        date = sap_date_parse(date_raw)
-        weekday = (date.weekday() + 1) % 7
+        weekday = sap_date_weekday(date_raw)
 
-        if match := re.fullmatch(r"PT(\d\d)H(\d\d)M00S", begin_raw):
+        if match := EVENT_TIME_RE.fullmatch(begin_raw):
             begin_time = f"{match.group(1)}:{match.group(2)}"
         else:
             raise RuntimeError(
                 f"Invalid begin time for {event_schedule_id}: {begin_raw}"
             )
 
-        if match := re.fullmatch(r"PT(\d\d)H(\d\d)M00S", end_raw):
+        if match := EVENT_TIME_RE.fullmatch(end_raw):
             end_time = f"{match.group(1)}:{match.group(2)}"
         else:
             raise RuntimeError(f"Invalid end time for {event_schedule_id}: {end_raw}")
@@ -362,8 +642,8 @@ def get_room_info(year: int, semester: int, event_schedule_id: str):
             room_id = room["Otjid"]
             room_name = room["Name"]
 
-            if match := re.fullmatch(r"(\d\d\d)-(\d\d\d\d)", room_name):
-                building = get_building_name(year, semester, room_id)
+            if match := ROOM_NAME_RE.fullmatch(room_name):
+                building = building_names[room_id]
                 room_number = int(match.group(2))
                 buildings.add(building)
                 room_numbers.add(room_number)
@@ -385,7 +665,7 @@ def get_room_info(year: int, semester: int, event_schedule_id: str):
     return rooms_by_time
 
 
-def get_course_schedule(year: int, semester: int, course_number: str):
+def get_course_schedule_query(year: int, semester: int, course_number: str):
     params = {
         "sap-client": "700",
         "$expand": ",".join(
@@ -395,14 +675,49 @@ def get_course_schedule(year: int, semester: int, course_number: str):
             ]
         ),
     }
-    raw_data = send_request(
-        f"SmObjectSet(Otjid='SM{course_number}',Peryr='{year}',Perid='{semester}',ZzCgOtjid='',ZzPoVersion='',ZzScOtjid='')/SeObjectSet?{urllib.parse.urlencode(params)}"
-    )
+    return f"SmObjectSet(Otjid='SM{course_number}',Peryr='{year}',Perid='{semester}',ZzCgOtjid='',ZzPoVersion='',ZzScOtjid='')/SeObjectSet?{urllib.parse.urlencode(params)}"
+
+
+def get_course_schedule_from_raw(
+    year: int, semester: int, course_number: str, raw_data: dict[str, Any]
+):
     raw_schedule_results = raw_data["d"]["results"]
     if len(raw_schedule_results) == 0:
         return []
 
+    # Fetch the room details of the events that refer to them, and then the
+    # building names of all rooms in the schedule, with a single batch request
+    # each instead of one request per room.
+    raw_schedule_items = [
+        raw_schedule_item
+        for raw_schedule in raw_schedule_results
+        for raw_schedule_item in raw_schedule["EObjectSet"]["results"]
+    ]
+    raw_room_infos = get_raw_room_infos(
+        year,
+        semester,
+        [x["Otjid"] for x in raw_schedule_items if x["RoomText"] == "ראה פרטים"],
+    )
+    room_ids = [
+        x["RoomId"]
+        for x in raw_schedule_items
+        if x["RoomText"] and ROOM_NAME_RE.fullmatch(x["RoomText"])
+    ]
+    room_ids += [
+        room["Otjid"]
+        for results in raw_room_infos.values()
+        for result in results
+        for room in result["Rooms"]["results"]
+        if ROOM_NAME_RE.fullmatch(room["Name"])
+    ]
+    building_names = get_building_names(year, semester, room_ids)
+    room_infos = {
+        event_schedule_id: parse_room_info(event_schedule_id, results, building_names)
+        for event_schedule_id, results in raw_room_infos.items()
+    }
+
     result = []
+    result_keys = set()
 
     def raw_schedule_sort_key(raw_schedule):
         # Sort by group id in ascending order, but place 0 groups at the end.
@@ -415,9 +730,11 @@ def get_course_schedule(year: int, semester: int, course_number: str):
         raw_schedule_items = raw_schedule["EObjectSet"]["results"]
         for raw_schedule_item in raw_schedule_items:
             category = raw_schedule_item["CategoryText"]
-            is_sport_course = re.fullmatch(r'03940[89]\d\d', course_number) is not None
+            is_sport_course = (
+                SPORT_COURSE_NUMBER_RE.fullmatch(course_number) is not None
+            )
             if is_sport_course:
-                if category not in ["ספורט", "נבחרת ספורט"]:
+                if category not in SPORT_SCHEDULE_CATEGORIES:
                     raise RuntimeError(f"Invalid category: {category}")
                 category = raw_schedule_item["Name"]
                 # Sometimes the item name is generic and the schedule group item
@@ -426,7 +743,7 @@ def get_course_schedule(year: int, semester: int, course_number: str):
                     category.startswith("ספורט חינוך גופני - ")
                     or category == "ספורט נבחרות ספורט"
                 ) and raw_schedule["Name"]:
-                    category = re.sub(r'^SE\d+\s*', '', raw_schedule["Name"])
+                    category = SCHEDULE_GROUP_PREFIX_RE.sub('', raw_schedule["Name"])
             # Temporary special case.
             elif (
                 course_number == "00950219"
@@ -434,7 +751,7 @@ def get_course_schedule(year: int, semester: int, course_number: str):
                 and raw_schedule_item["Name"].startswith("תרגיל")
             ):
                 category = "תרגול"
-            elif category not in ["הרצאה", "תרגול", "מעבדה", "פרויקט", "סמינר"]:
+            elif category not in SCHEDULE_CATEGORIES:
                 raise RuntimeError(f"Invalid category: {category}")
 
             building = ""
@@ -442,27 +759,24 @@ def get_course_schedule(year: int, semester: int, course_number: str):
             building_room_dict = None
             building_and_room = raw_schedule_item["RoomText"]
             if building_and_room:
-                if match := re.fullmatch(r"(\d\d\d)-(\d\d\d\d)", building_and_room):
-                    building = get_building_name(
-                        year, semester, raw_schedule_item["RoomId"]
-                    )
+                if match := ROOM_NAME_RE.fullmatch(building_and_room):
+                    building = building_names[raw_schedule_item["RoomId"]]
                     room = int(match.group(2))
                 elif building_and_room == "ראה פרטים":
-                    building_room_dict = get_room_info(
-                        year, semester, raw_schedule_item["Otjid"]
-                    )
+                    building_room_dict = room_infos[raw_schedule_item["Otjid"]]
                 else:
                     raise RuntimeError(
                         f"Invalid building and room: {building_and_room}"
                     )
 
-            staff = ""
+            staff_lines = []
             for person in raw_schedule_item["Persons"]["results"]:
+                staff_line = f"{person['FirstName']} {person['LastName']}"
                 title = person["Title"].strip()
                 if title and title != "-":
-                    staff += f"{title} "
-                staff += f"{person['FirstName']} {person['LastName']}\n"
-            staff = staff.rstrip("\n")
+                    staff_line = f"{title} {staff_line}"
+                staff_lines.append(staff_line)
+            staff = "\n".join(staff_lines)
 
             event_id = raw_schedule_item["Otjid"]
 
@@ -489,46 +803,33 @@ def get_course_schedule(year: int, semester: int, course_number: str):
             # Skip specific dates like:
             # "27.05.: 10:00-12:00".
             # "02.02., 03.02., 04.02., בהתאמה 08:00-17:00"
-            if re.fullmatch(
-                r"\d\d\.\d\d\.: \d\d:\d\d-\d\d:\d\d", date_and_time_list
-            ) or re.fullmatch(
-                r"(\d\d\.\d\d\., )+בהתאמה \d\d:\d\d-\d\d:\d\d", date_and_time_list
-            ):
+            if SCHEDULE_SINGLE_DATE_RE.fullmatch(
+                date_and_time_list
+            ) or SCHEDULE_MULTIPLE_DATES_RE.fullmatch(date_and_time_list):
                 continue
 
-            date_and_time_list = re.sub(r"^מ \d\d\.\d\d\., ", "", date_and_time_list)
-            date_and_time_list = re.sub(r"^עד \d\d\.\d\d\., ", "", date_and_time_list)
-            date_and_time_list = re.sub(
-                r"^\d\d\.\d\d\. עד \d\d\.\d\d\., ", "", date_and_time_list
-            )
-            date_and_time_list = re.sub(r", יוצא מן הכלל: .*$", "", date_and_time_list)
-            date_and_time_list = re.sub(r", הכל \d+ ימים$", "", date_and_time_list)
-            date_and_time_list = [x.strip() for x in date_and_time_list.split(",")]
-            for date_and_time in date_and_time_list:
-                match = re.fullmatch(
-                    r"(?:יום|יוֹם) (רִאשׁוֹ|שני|שלישי|רביעי|חמישי|שישי)"
-                    r" (\d\d:\d\d)\s*-\s*(\d\d:\d\d)",
-                    date_and_time,
-                )
+            date_and_time_list = SCHEDULE_DATES_RE.sub("", date_and_time_list)
+            # The pattern allows surrounding whitespace, so the items don't
+            # have to be stripped.
+            for date_and_time in date_and_time_list.split(","):
+                match = SCHEDULE_DAY_AND_TIME_RE.fullmatch(date_and_time)
                 if not match:
-                    raise RuntimeError(f"Invalid date and time: {date_and_time}")
+                    raise RuntimeError(
+                        f"Invalid date and time: {date_and_time.strip()}"
+                    )
 
                 day = match.group(1)
-                day = "ראשון" if day == "רִאשׁוֹ" else day
+                day = SCHEDULE_DAY_NAME_FIXES.get(day, day)
                 time_begin = match.group(2)
                 time_end = match.group(3)
                 time = f"{time_begin} - {time_end}"
 
                 if building_room_dict:
-                    days = [
-                        "ראשון",
-                        "שני",
-                        "שלישי",
-                        "רביעי",
-                        "חמישי",
-                        "שישי",
-                    ]
-                    weekday_and_time = (days.index(day), time_begin, time_end)
+                    weekday_and_time = (
+                        SCHEDULE_DAY_INDEXES[day],
+                        time_begin,
+                        time_end,
+                    )
                     building, room = building_room_dict.get(weekday_and_time, ("", 0))
 
                 result_item = {
@@ -542,7 +843,19 @@ def get_course_schedule(year: int, semester: int, course_number: str):
                     "מס.": event_id,
                 }
 
-                if result_item not in result:
+                # All of the item's values, in the same order.
+                result_key = (
+                    group_id,
+                    category,
+                    day,
+                    time,
+                    building,
+                    room,
+                    staff,
+                    event_id,
+                )
+                if result_key not in result_keys:
+                    result_keys.add(result_key)
                     result.append(result_item)
                 else:
                     print(
@@ -573,7 +886,7 @@ def get_course_schedule(year: int, semester: int, course_number: str):
             new_id = (event["קבוצה"] // 10) * 10
             fallback_new_id = event_id_to_group[old_id][0]
 
-        while new_id in assigned_ids.values() and not (
+        while new_id in new_ids_events and not (
             new_ids_events[new_id][0]["קבוצה"] == event["קבוצה"]
             and all(x["סוג"] != event["סוג"] for x in new_ids_events[new_id])
         ):
@@ -593,30 +906,22 @@ def get_course_schedule(year: int, semester: int, course_number: str):
         new_ids_events.setdefault(new_id, []).append(event)
 
     # Make sure each event of same category and id matches in all groups.
-    for category in set(x["סוג"] for x in result):
-        for id in set(x["מס."] for x in result if x["סוג"] == category):
-            events_same_category_and_id = [
-                x for x in result if x["סוג"] == category and x["מס."] == id
-            ]
-            event_groups = set(x["קבוצה"] for x in events_same_category_and_id)
-
-            events_grouped = set()
-            for group in event_groups:
-                events_grouped.add(
-                    frozenset(
-                        [
-                            tuple({**x, "קבוצה": None}.items())
-                            for x in events_same_category_and_id
-                            if x["קבוצה"] == group
-                        ]
-                    )
-                )
+    events_by_category_and_id = {}
+    for event in result:
+        events_by_group = events_by_category_and_id.setdefault(
+            (event["סוג"], event["מס."]), {}
+        )
+        events_by_group.setdefault(event["קבוצה"], set()).add(
+            tuple(event[key] for key in SCHEDULE_EVENT_COMPARISON_KEYS)
+        )
 
-            if len(events_grouped) != 1:
-                raise RuntimeError(
-                    f"Invalid events for category {category} and id {id}:"
-                    f" {events_grouped}"
-                )
+    for (category, id), events_by_group in events_by_category_and_id.items():
+        events_grouped = set(frozenset(x) for x in events_by_group.values())
+        if len(events_grouped) != 1:
+            raise RuntimeError(
+                f"Invalid events for category {category} and id {id}:"
+                f" {events_grouped}"
+            )
 
     return result
 
@@ -639,11 +944,13 @@ def get_exam_date_time(exam_data: list[dict[str, Any]], exam_category: str):
         raise RuntimeError(f"Invalid parent exam: {exam_data}")
 
     # Sort by the order of root exams, place root items first.
+    root_exam_indexes = {id: i for i, id in enumerate(root_exam_ids)}
+
     def exam_data_sort_key(exam):
         id = exam["ZzExamOfferParentGuid"]
         if not id:
             id = exam["ZzExamOfferGuid"]
-        return root_exam_ids.index(id), exam["ZzExamOfferParentGuid"] != ""
+        return root_exam_indexes[id], exam["ZzExamOfferParentGuid"] != ""
 
     result_items = []
     dates_with_time = set()
@@ -658,21 +965,11 @@ def get_exam_date_time(exam_data: list[dict[str, Any]], exam_category: str):
         if not date_raw:
             continue
 
-        date = sap_date_parse(date_raw).strftime("%d-%m-%Y")
+        exam_date = sap_date_parse(date_raw)
+        date = f"{exam_date.day:02d}-{exam_date.month:02d}-{exam_date.year:04d}"
 
-        time_begin_raw = exam["ExamBegTime"]
-        match = re.fullmatch(r"PT(\d\d)H(\d\d)M\d\dS", time_begin_raw)
-        if not match:
-            raise RuntimeError(f"Invalid time: {time_begin_raw}")
-
-        time_begin = match.group(1) + ":" + match.group(2)
-
-        time_end_raw = exam["ExamEndTime"]
-        match = re.fullmatch(r"PT(\d\d)H(\d\d)M\d\dS", time_end_raw)
-        if not match:
-            raise RuntimeError(f"Invalid time: {time_end_raw}")
-
-        time_end = match.group(1) + ":" + match.group(2)
+        time_begin = sap_exam_time_parse(exam["ExamBegTime"])
+        time_end = sap_exam_time_parse(exam["ExamEndTime"])
 
         time = f"{time_begin} - {time_end}"
 
@@ -693,8 +990,14 @@ def get_exam_date_time(exam_data: list[dict[str, Any]], exam_category: str):
     return "\n".join(result_items)
 
 
-def get_course_full_data(year: int, semester: int, course_number: str):
-    sap_course = get_sap_course(year, semester, course_number)
+def get_course_full_data(
+    year: int,
+    semester: int,
+    course_number: str,
+    raw_sap_course: dict[str, Any],
+    raw_schedule: dict[str, Any],
+):
+    sap_course = parse_sap_course(course_number, raw_sap_course)
 
     course_number = sap_course["Otjid"]
     if course_number.startswith("SM"):
@@ -703,13 +1006,12 @@ def get_course_full_data(year: int, semester: int, course_number: str):
         raise RuntimeError(f"Invalid course number: {course_number}")
 
     points = sap_course["Points"]
-    points = re.sub(r"(\.[1-9]+)0+$", r"\1", points)
-    points = re.sub(r"\.0+$", r"", points)
+    points = POINTS_TRAILING_ZEROS_RE.sub(r"\1", points)
 
-    responsible = ""
-    for person in sap_course["Responsible"]["results"]:
-        responsible += f"{person['Title']} {person['FirstName']} {person['LastName']}\n"
-    responsible = responsible.rstrip("\n")
+    responsible = "\n".join(
+        f"{person['Title']} {person['FirstName']} {person['LastName']}"
+        for person in sap_course["Responsible"]["results"]
+    )
 
     rel = []
     rel_including = []
@@ -729,29 +1031,31 @@ def get_course_full_data(year: int, semester: int, course_number: str):
         else:
             raise RuntimeError(f"Invalid relationship: {rel_item['ZzRelationshipKey']}")
 
-    prereq = ""
+    prereq_parts = []
     for prereq_item in sap_course["SmPrereq"]["results"]:
-        prereq += prereq_item["Bracket"]
+        prereq_parts.append(prereq_item["Bracket"])
         if prereq_item["ModuleId"].lstrip("0"):
-            prereq += prereq_item["ModuleId"]
+            prereq_parts.append(prereq_item["ModuleId"])
         if prereq_item["Operator"] == "AND":
-            prereq += f" ו-"
+            prereq_parts.append(" ו-")
         elif prereq_item["Operator"] == "OR":
-            prereq += f" או "
+            prereq_parts.append(" או ")
         elif prereq_item["Operator"]:
             raise RuntimeError(f"Invalid operator: {prereq_item['Operator']}")
-    prereq = re.sub(r"\((\d+)\)", r"\1", prereq)
-    prereq = re.sub(r"^\(([^()]+)\)$", r"\1", prereq)
+    prereq = "".join(prereq_parts)
+    prereq = PREREQ_SINGLE_COURSE_RE.sub(r"\1", prereq)
+    prereq = PREREQ_OUTER_PARENTHESES_RE.sub(r"\1", prereq)
 
     adjoining = []
-    if match := re.search(
-        r"^(?:מקצוע צמוד|מקצועות צמודים):(.*)",
-        sap_course["ZzSemesterNote"],
-        flags=re.MULTILINE,
+    semester_note = sap_course["ZzSemesterNote"]
+    # Most notes don't mention adjoining courses, skip the regex search for
+    # them with a cheap substring check.
+    if "צמוד" in semester_note and (
+        match := ADJOINING_COURSES_RE.search(semester_note)
     ):
         for adjoining_course in match.group(1).split(","):
             adjoining_course = adjoining_course.strip()
-            if not re.fullmatch(r"\d{5,8}", adjoining_course):
+            if not ADJOINING_COURSE_NUMBER_RE.fullmatch(adjoining_course):
                 raise RuntimeError(f"Invalid adjoining course: {adjoining_course}")
 
             if len(adjoining_course) <= 6:
@@ -791,7 +1095,7 @@ def get_course_full_data(year: int, semester: int, course_number: str):
         {
             "נקודות": points,
             "אחראים": responsible,
-            "הערות": sap_course["ZzSemesterNote"],
+            "הערות": semester_note,
         }
     )
 
@@ -811,7 +1115,7 @@ def get_course_full_data(year: int, semester: int, course_number: str):
         if exam_date_time:
             general[exam] = exam_date_time
 
-    schedule = get_course_schedule(year, semester, course_number)
+    schedule = get_course_schedule_from_raw(year, semester, course_number, raw_schedule)
 
     return {
         "general": general,
@@ -819,13 +1123,37 @@ def get_course_full_data(year: int, semester: int, course_number: str):
     }
 
 
-def get_course_full_data_star(args):
+def get_courses_full_data(year: int, semester: int, course_numbers: list[str]):
+    # Fetch the courses and their schedules in a single batch request.
+    queries = []
+    for course_number in course_numbers:
+        queries.append(get_sap_course_query(year, semester, course_number))
+        queries.append(
+            get_course_schedule_query(year, semester, course_number.removeprefix("SM"))
+        )
+
     try:
-        return get_course_full_data(*args)
+        raw_data_list = send_batch_request(queries)
     except Exception:
-        print(f"Failed to get course data for {args}")
+        print(f"Failed to get course data for {(year, semester, course_numbers)}")
         raise
 
+    result = []
+    for course_number, raw_sap_course, raw_schedule in zip(
+        course_numbers, raw_data_list[::2], raw_data_list[1::2]
+    ):
+        try:
+            result.append(
+                get_course_full_data(
+                    year, semester, course_number, raw_sap_course, raw_schedule
+                )
+            )
+        except Exception:
+            print(f"Failed to get course data for {(year, semester, course_number)}")
+            raise
+
+    return result
+
 
 def postprocess_2024_200_201(result: list[dict], output_file: Path):
     unprocessed_file = output_file.with_stem(f"{output_file.stem}.unfiltered")
@@ -856,8 +1184,7 @@ def postprocess_2024_200_201(result: list[dict], output_file: Path):
                 schedule.append(s)
             item["schedule"] = schedule
 
-    with output_file.open("w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    output_file.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
 
     return result
 
@@ -871,40 +1198,110 @@ def run(
 ):
     print(f'Fetching data for {year}-{semester}...')
 
-    course_numbers = sorted(get_sap_course_numbers(year, semester))
+    course_numbers = get_sap_course_numbers(year, semester)
+
+    course_number_chunks = [
+        course_numbers[i : i + COURSES_PER_BATCH_REQUEST]
+        for i in range(0, len(course_numbers), COURSES_PER_BATCH_REQUEST)
+    ]
+
+    # The postprocessing needs the whole result, and the min.js file is then
+    # written from the postprocessed result. Otherwise, both files are written
+    # as the courses are fetched, and only the current batch is kept in memory.
+    keep_result = run_postprocessing and year == 2024 and semester in [200, 201]
+    result = []
+
+    # The work is network-bound, so threads sharing a single session (and its
+    # connection pool) are enough, without the overhead of worker processes.
+    # Each course is written as soon as it's fetched, in the same format as
+    # orjson's OPT_INDENT_2 (compact for the min.js file). The courses are
+    # written to temporary files which replace the output files only when
+    # they're complete, so that a failed run doesn't leave truncated files.
+    temp_output_file = output_file.with_name(f"{output_file.name}.{os.getpid()}.tmp")
+    temp_min_js_output_file = None
+    if min_js_output_file and not keep_result:
+        temp_min_js_output_file = min_js_output_file.with_name(
+            f"{min_js_output_file.name}.{os.getpid()}.tmp"
+        )
 
-    with Pool(POOL_CONCURRENT_PROCESSES) as pool:
-        args = list(
-            zip(
+    executor = ThreadPoolExecutor(POOL_CONCURRENT_THREADS)
+    try:
+        with ExitStack() as stack:
+            f = stack.enter_context(temp_output_file.open("wb"))
+            min_js_f = None
+            if temp_min_js_output_file:
+                min_js_f = stack.enter_context(temp_min_js_output_file.open("wb"))
+                min_js_f.write(b"var courses_from_rishum = [")
+            progress = stack.enter_context(tqdm(total=len(course_numbers)))
+
+            separator = b"[\n  "
+            min_js_separator = b""
+            for courses_full_data in executor.map(
+                get_courses_full_data,
                 repeat(year),
                 repeat(semester),
-                course_numbers,
-            )
-        )
-        result = list(tqdm(pool.imap(get_course_full_data_star, args), total=len(args)))
+                course_number_chunks,
+            ):
+                for item in courses_full_data:
+                    item_json = orjson.dumps(item, option=orjson.OPT_INDENT_2)
+                    f.write(separator + item_json.replace(b"\n", b"\n  "))
+                    separator = b",\n  "
+                    if min_js_f:
+                        min_js_f.write(min_js_separator + orjson.dumps(item))
+                        min_js_separator = b","
+                if keep_result:
+                    result.extend(courses_full_data)
+                progress.update(len(courses_full_data))
+
+            f.write(b"[]" if separator == b"[\n  " else b"\n]")
+            if min_js_f:
+                min_js_f.write(b"]")
+    except BaseException:
+        # Unlike exiting the executor's context, don't wait for the running
+        # batches, which might be retrying a request for a long time.
+        stop_retrying.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        temp_output_file.unlink(missing_ok=True)
+        if temp_min_js_output_file:
+            temp_min_js_output_file.unlink(missing_ok=True)
+        raise
 
-    with output_file.open("w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    executor.shutdown()
+    temp_output_file.replace(output_file)
+    if temp_min_js_output_file:
+        temp_min_js_output_file.replace(min_js_output_file)
 
-    if run_postprocessing:
-        if year == 2024 and semester in [200, 201]:
-            result = postprocess_2024_200_201(result, output_file)
+    if keep_result:
+        result = postprocess_2024_200_201(result, output_file)
 
-    if min_js_output_file:
-        with min_js_output_file.open("w", encoding="utf-8") as f:
-            f.write("var courses_from_rishum = ")
-            json.dump(result, f, ensure_ascii=False)
+        if min_js_output_file:
+            min_js_output_file.write_bytes(
+                b"var courses_from_rishum = " + orjson.dumps(result)
+            )
 
 
 def main():
+    global CACHE_DIR, CACHE_REFRESH, POOL_CONCURRENT_THREADS
+
     parser = argparse.ArgumentParser()
     parser.add_argument("year_and_semester")
     parser.add_argument("output_file")
     parser.add_argument("--min-js-output-file", default=None)
     parser.add_argument("--last-semesters-output-file", default=None)
     parser.add_argument("--run-postprocessing", action="store_true")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--refresh-cache", action="store_true")
+    parser.add_argument("--threads", type=int, default=POOL_CONCURRENT_THREADS)
     args = parser.parse_args()
 
+    POOL_CONCURRENT_THREADS = args.threads
+    mount_http_adapter(POOL_CONCURRENT_THREADS)
+
+    if args.cache_dir:
+        CACHE_DIR = Path(args.cache_dir)
+
+    CACHE_REFRESH = args.refresh_cache
+
     year_and_semester = args.year_and_semester.split("-")
     if len(year_and_semester) != 2:
         raise RuntimeError(f"Invalid year_and_semester: {year_and_semester}")
@@ -916,8 +1313,9 @@ def main():
         last_semesters = get_last_semesters(semester_count)
 
         if args.last_semesters_output_file:
-            with Path(args.last_semesters_output_file).open("w", encoding="utf-8") as f:
-                json.dump(last_semesters, f, indent=2, ensure_ascii=False)
+            Path(args.last_semesters_output_file).write_bytes(
+                orjson.dumps(last_semesters, option=orjson.OPT_INDENT_2)
+            )
 
         for last_semester in last_semesters:
             year = last_semester["year"]